@@ -1,13 +1,14 @@
+from config import CONFIG
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import os
-from dotenv import load_dotenv
+import hmac
+import threading
+import time
 import logging
 from quiz_solver import QuizSolver
-import threading
-
-# Load environment variables
-load_dotenv()
+from browser_handler import BrowserPool
+from concurrent.futures import ThreadPoolExecutor
+import atexit
 
 app = Flask(__name__)
 CORS(app)
@@ -20,15 +21,55 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Load configuration
-STUDENT_EMAIL = os.getenv('STUDENT_EMAIL')
-SECRET_KEY = os.getenv('SECRET_KEY')
-PORT = int(os.getenv('PORT', 5000))
+STUDENT_EMAIL = CONFIG.STUDENT_EMAIL
+SECRET_KEY = CONFIG.SECRET_KEY
+PORT = CONFIG.PORT
+
+# Pre-computed forms used by request validation
+SECRET_KEY_BYTES = (SECRET_KEY or '').encode()
+STUDENT_EMAIL_CI = (STUDENT_EMAIL or '').casefold()
+
+# Shared pool of pre-launched browsers, so quiz runs don't pay a Chrome launch each
+BROWSER_POOL = BrowserPool(
+    size=CONFIG.BROWSER_POOL_SIZE,
+    acquire_timeout=CONFIG.BROWSER_POOL_TIMEOUT,
+    recycle_after=CONFIG.BROWSER_POOL_RECYCLE_AFTER,
+    min_ready=CONFIG.BROWSER_POOL_MIN_READY
+)
+atexit.register(BROWSER_POOL.close)
+
+# Launch the pool in the background so boot and /health are never blocked on Chrome
+threading.Thread(target=BROWSER_POOL.warm, name='browser-pool-warmup', daemon=True).start()
+
+# One solver shared by all quiz runs; it keeps no per-run state
+SOLVER = QuizSolver(STUDENT_EMAIL, SECRET_KEY, BROWSER_POOL)
+
+# Fixed set of worker threads for quiz chains, sized to match the browser pool
+EXECUTOR = ThreadPoolExecutor(
+    max_workers=CONFIG.QUIZ_WORKERS,
+    thread_name_prefix='quiz'
+)
+atexit.register(EXECUTOR.shutdown, wait=False)
+
+def _log_quiz_failure(future):
+    """Surface exceptions raised inside a quiz worker"""
+    exc = future.exception()
+    if exc:
+        logger.error("Quiz chain crashed", exc_info=exc)
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy"}), 200
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness endpoint: 200 once enough pooled browsers have launched"""
+    # ready() latches, so recycling a browser never flips the instance unhealthy
+    if not BROWSER_POOL.ready():
+        return jsonify({"status": "warming", "idle_browsers": BROWSER_POOL.qsize()}), 503
+    return jsonify({"status": "ready", "idle_browsers": BROWSER_POOL.qsize()}), 200
+
 @app.route('/quiz', methods=['POST'])
 def receive_quiz():
     """
@@ -42,9 +83,9 @@ def receive_quiz():
     """
     try:
         # Parse JSON payload
-        data = request.get_json()
+        data = request.get_json(silent=True, cache=True)
         
-        if not data:
+        if not data or not isinstance(data, dict):
             logger.error("Invalid JSON payload received")
             return jsonify({"error": "Invalid JSON payload"}), 400
         
@@ -54,26 +95,26 @@ def receive_quiz():
         quiz_url = data.get('url')
         
         # Validate required fields
-        if not all([email, secret, quiz_url]):
+        if not (email and secret and quiz_url):
             logger.error("Missing required fields")
             return jsonify({"error": "Missing required fields: email, secret, url"}), 400
         
-        # Verify secret
-        if secret != SECRET_KEY:
+        # Verify secret (constant-time to avoid leaking it through timing)
+        if not hmac.compare_digest(str(secret).encode(), SECRET_KEY_BYTES):
             logger.error(f"Invalid secret provided for email: {email}")
             return jsonify({"error": "Invalid secret"}), 403
         
         # Verify email matches
-        if email != STUDENT_EMAIL:
+        if str(email).casefold() != STUDENT_EMAIL_CI:
             logger.warning(f"Email mismatch: expected {STUDENT_EMAIL}, got {email}")
         
         logger.info(f"Received valid quiz request for URL: {quiz_url}")
         
-        # Start quiz solving in background thread
-        solver = QuizSolver(email, secret)
-        thread = threading.Thread(target=solver.solve_quiz_chain, args=(quiz_url,))
-        thread.daemon = True
-        thread.start()
+        # Queue quiz solving on the worker pool. The time limit starts now, not
+        # when a worker frees up, so a queued chain can't outlive the quiz window.
+        deadline = time.monotonic() + SOLVER.time_limit
+        future = EXECUTOR.submit(SOLVER.solve_quiz_chain, quiz_url, deadline)
+        future.add_done_callback(_log_quiz_failure)
         
         return jsonify({
             "status": "accepted",
@@ -92,11 +133,13 @@ def index():
         "status": "running",
         "endpoints": {
             "health": "/health",
+            "ready": "/ready",
             "quiz": "/quiz (POST)"
         }
     }), 200
 
+# Development server only; production runs wsgi.py under gunicorn
 if __name__ == '__main__':
     logger.info(f"Starting Flask server on port {PORT}")
     logger.info(f"Configured for email: {STUDENT_EMAIL}")
-    app.run(host='0.0.0.0', port=PORT, debug=os.getenv('DEBUG', 'False').lower() == 'true')
+    app.run(host=CONFIG.HOST, port=PORT, debug=CONFIG.DEBUG)
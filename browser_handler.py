@@ -5,52 +5,389 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import logging
-import time
 import shutil
 import os
-from bs4 import BeautifulSoup
+import sys
+import queue
+import weakref
+import threading
+import time
+import atexit
+from contextlib import contextmanager
 from selenium.common.exceptions import TimeoutException
+import lxml.html
+from lxml import etree
 
 logger = logging.getLogger(__name__)
 
-class BrowserHandler:
-    """Handles headless browser operations for JavaScript-rendered pages"""
-    
-    def __init__(self):
-        self.driver = None
-    
-    def initialize_driver(self):
-        """Initialize headless Chrome browser using the system chromedriver."""
-        try:
-            chrome_bin = os.environ.get("CHROME_BIN", "/usr/bin/chromium")
+# Assets a text-only fetch never needs; blocked at the network layer.
+# Stylesheets are kept because innerText depends on computed visibility.
+BLOCKED_RESOURCE_PATTERNS = [
+    pattern
+    for ext in ("png", "jpg", "jpeg", "gif", "webp", "avif", "ico", "bmp",
+                "woff", "woff2", "ttf", "otf", "eot",
+                "mp4", "webm", "ogg", "mp3", "wav", "m4a")
+    for pattern in (f"*.{ext}", f"*.{ext}?*")
+]
+
+# Fallback selectors probed inside the page in one round-trip; the first
+# element with meaningful text wins
+_FALLBACK_JS = (
+    "const sels = ['#result', '.result', '.content', 'main', 'article', 'body'];"
+    "for (const s of sels) {"
+    "  const e = document.querySelector(s);"
+    "  if (e && e.innerText.trim().length > 20) return e.innerText;"
+    "}"
+    "return null;"
+)
+
+# Containers considered when parsing page_source ourselves, in document order
+_FALLBACK_XPATH = etree.XPath(
+    "//main | //article | //*[@id='result' or @id='content']"
+    " | //*[contains(concat(' ', normalize-space(@class), ' '), ' content ')]"
+    " | //body | //div"
+)
+
+
+def _node_text(node):
+    """Visible text of an lxml node, one stripped line per text fragment"""
+    return "\n".join(t.strip() for t in node.itertext() if t.strip())
+
+
+# Binary locations are resolved once at import, never per driver launch
+CHROME_BIN = os.environ.get("CHROME_BIN", "/usr/bin/chromium")
+CHROMEDRIVER_PATH = (
+    os.environ.get("CHROMEDRIVER_PATH")
+    or shutil.which("chromedriver")
+    or "/usr/bin/chromedriver"
+)
+CHROME_SINGLE_PROCESS = os.environ.get("CHROME_SINGLE_PROCESS", "true").lower() == "true"
+
+# Chrome flags, fixed for the life of the process
+_CHROME_ARGS = (
+    # Headless and container-friendly flags. No fixed --remote-debugging-port:
+    # pooled browsers run side by side and would collide on the same port.
+    "--headless=new",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--window-size=1920,1080",
+    # Trim background services a short-lived scraping browser never uses
+    "--disable-background-networking",
+    "--disable-sync",
+    "--disable-default-apps",
+    "--disable-renderer-backgrounding",
+    "--disable-features=TranslateUI,BlinkGenPropertyTrees",
+    "--metrics-recording-only",
+    "--mute-audio",
+) + (
+    # Collapse Chrome's process tree. Less stable than multi-process mode, which
+    # pooled browsers tolerate because they are recycled; set
+    # CHROME_SINGLE_PROCESS=false to opt out.
+    ("--single-process", "--no-zygote") if CHROME_SINGLE_PROCESS else ()
+)
+
 
+class _SharedService(Service):
+    """chromedriver process started once and shared by every driver session"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._start_lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        with self._start_lock:
+            if self._started and self.process.poll() is None:
+                return
+            super().start()
+            self._started = True
+
+    def stop(self):
+        # Quitting one driver must not kill the chromedriver other sessions use
+        pass
+
+    def shutdown(self):
+        """Stop the shared chromedriver process"""
+        with self._start_lock:
+            if self._started:
+                super().stop()
+                self._started = False
+
+
+_SHARED_SERVICE = None
+_SHARED_SERVICE_LOCK = threading.Lock()
+
+
+def get_shared_service():
+    """Return the process-wide chromedriver service, creating it on first use"""
+    global _SHARED_SERVICE
+    with _SHARED_SERVICE_LOCK:
+        if _SHARED_SERVICE is None:
             # Debug info
             logger.info(
-                "Using system chromedriver at /usr/bin/chromedriver, CHROME_BIN=%s, which chromium=%s",
-                chrome_bin, shutil.which("chromium") or shutil.which("chromium-browser")
+                "Using system chromedriver at %s, CHROME_BIN=%s, which chromium=%s",
+                CHROMEDRIVER_PATH, CHROME_BIN,
+                shutil.which("chromium") or shutil.which("chromium-browser")
             )
+            _SHARED_SERVICE = _SharedService(CHROMEDRIVER_PATH)
+        return _SHARED_SERVICE
+
+
+def shutdown_shared_service():
+    """Stop the shared chromedriver, if one was started. Safe to call repeatedly."""
+    with _SHARED_SERVICE_LOCK:
+        service = _SHARED_SERVICE
+    if service is not None:
+        service.shutdown()
+
+
+# Registered at import, i.e. before any pool's close() hook, so that atexit
+# (which runs last-registered first) quits the sessions before chromedriver
+atexit.register(shutdown_shared_service)
+
+
+def _build_options(binary):
+    """Fresh Options for one launch, filled from the prebuilt flag tuple"""
+    opts = Options()
+    opts.binary_location = binary
+    for arg in _CHROME_ARGS:
+        opts.add_argument(arg)
+    return opts
+
+
+def launch_driver():
+    """
+    Launch a headless Chrome browser using the system chromedriver.
 
-            chrome_options = Options()
-            chrome_options.binary_location = chrome_bin
+    Returns:
+        A ready-to-use webdriver.Chrome instance (raises on failure)
+    """
+    chrome_options = _build_options(CHROME_BIN)
 
-            # Headless and container-friendly flags
-            chrome_options.add_argument("--headless=new")
-            chrome_options.add_argument("--no-sandbox")
-            chrome_options.add_argument("--disable-dev-shm-usage")
-            chrome_options.add_argument("--disable-gpu")
-            chrome_options.add_argument("--disable-extensions")
-            chrome_options.add_argument("--window-size=1920,1080")
-            chrome_options.add_argument("--remote-debugging-port=9222")
+    # Every session talks to the same chromedriver; only Chrome itself is per-driver
+    driver = webdriver.Chrome(service=get_shared_service(), options=chrome_options)
 
-            # Use the system-installed chromedriver binary
-            service = Service("/usr/bin/chromedriver")
-            self.driver = webdriver.Chrome(service=service, options=chrome_options)
+    # Timeouts. No implicit wait: every lookup here goes through an explicit
+    # WebDriverWait, and an implicit wait would add its delay to each poll.
+    driver.set_page_load_timeout(30)
 
-            # Timeouts
-            self.driver.set_page_load_timeout(30)
-            self.driver.implicitly_wait(5)
+    logger.info("Chrome driver initialized successfully (system chromedriver)")
+    return driver
 
-            logger.info("Chrome driver initialized successfully (system chromedriver)")
+
+def _shutdown_driver(driver):
+    """Finalizer for handler-owned drivers; never raises"""
+    if sys.is_finalizing():
+        return
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+class BrowserPool:
+    """Bounded pool of pre-launched Chrome drivers shared across quiz runs"""
+
+    def __init__(self, size, acquire_timeout=60, recycle_after=20, min_ready=1):
+        """
+        Args:
+            size: Maximum number of browsers alive at once
+            acquire_timeout: Seconds to wait for a free browser before giving up
+            recycle_after: Checkouts after which a browser is quit and relaunched
+            min_ready: Successful launches after which ready() reports True
+        """
+        self.size = max(1, size)
+        self.acquire_timeout = acquire_timeout
+        self.recycle_after = recycle_after
+        self.min_ready = min(max(1, min_ready), self.size)
+        # LIFO so the most recently used (warmest) browser is handed out first
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self._checkouts = {}
+        self._launched = 0
+        self._closed = False
+        self._launches = 0
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def warm(self, retries=3):
+        """
+        Launch browsers until the pool is full. Failures are logged, not raised.
+
+        Args:
+            retries: Failed launches tolerated (with a growing pause) before giving up
+        """
+        failures = 0
+        while True:
+            with self._lock:
+                if self._launched >= self.size:
+                    return
+                self._launched += 1
+            try:
+                driver = self._launch()
+            except Exception:
+                logger.exception("Failed to pre-launch pooled browser")
+                with self._lock:
+                    self._launched -= 1
+                failures += 1
+                if failures > retries:
+                    return
+                time.sleep(2 * failures)
+                continue
+            self._idle.put(driver)
+
+    def _launch(self):
+        """Launch one pooled browser and count it toward readiness"""
+        driver = launch_driver()
+        self._checkouts[id(driver)] = 0
+        with self._lock:
+            self._launches += 1
+            if self._launches >= self.min_ready:
+                self._ready = True
+        return driver
+
+    def ready(self):
+        """
+        True once min_ready launches have succeeded, from warm-up, lazy
+        launches or relaunches alike. It latches: recycling never clears it.
+        """
+        return self._ready
+
+    def qsize(self):
+        """Number of idle browsers ready to be acquired"""
+        return self._idle.qsize()
+
+    @contextmanager
+    def acquire(self):
+        """Check out a browser for the duration of a `with` block"""
+        driver = self._get()
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def _get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._lock:
+                can_launch = self._launched < self.size
+                if can_launch:
+                    self._launched += 1
+
+            if can_launch:
+                try:
+                    driver = self._launch()
+                except Exception:
+                    with self._lock:
+                        self._launched -= 1
+                    raise
+                return driver
+
+            # Wait in short slices so a slot freed by a failed relaunch is noticed
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"No browser available after {self.acquire_timeout}s")
+            try:
+                return self._idle.get(timeout=min(remaining, 1.0))
+            except queue.Empty:
+                pass
+
+    def release(self, driver):
+        """Return a browser to the pool, recycling it once it has been used enough"""
+        count = self._checkouts.pop(id(driver), 0) + 1
+        if count >= self.recycle_after:
+            logger.info("Recycling pooled browser after %s checkouts", count)
+            self._discard(driver)
+            return
+        if not self._reset(driver):
+            self._discard(driver)
+            return
+        self._checkouts[id(driver)] = count
+        self._idle.put(driver)
+
+    def _reset(self, driver):
+        """Wipe cookies/storage and park the browser on a blank page for reuse"""
+        try:
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            driver.execute_script(
+                "try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}"
+            )
+            driver.get("about:blank")
+            return True
+        except Exception:
+            logger.warning("Pooled browser failed to reset, discarding it", exc_info=True)
+            return False
+
+    def _discard(self, driver, relaunch=True):
+        """Quit a browser and, unless the pool is closing, launch its replacement"""
+        try:
+            driver.quit()
+        except Exception:
+            logger.exception("Error closing pooled browser")
+
+        if relaunch and not self._closed:
+            # Keep the freed slot: hand a fresh browser straight to the idle queue
+            # so threads already waiting in _get() pick it up
+            try:
+                replacement = self._launch()
+            except Exception:
+                logger.exception("Failed to relaunch pooled browser")
+            else:
+                self._idle.put(replacement)
+                return
+
+        with self._lock:
+            self._launched -= 1
+
+    def close(self):
+        """Quit every idle browser in the pool, then the chromedriver they share"""
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._checkouts.pop(id(driver), None)
+            self._discard(driver, relaunch=False)
+        shutdown_shared_service()
+
+
+class BrowserHandler:
+    """Handles headless browser operations for JavaScript-rendered pages"""
+    
+    def __init__(self, driver=None, block_resources=True):
+        """
+        Args:
+            driver: Optional externally-owned driver (e.g. from a BrowserPool).
+                    When given, close() leaves it running for its owner.
+            block_resources: Skip downloading images, fonts and media. Disable
+                    for pages that need full rendering.
+        """
+        self.driver = driver
+        self.block_resources = block_resources
+        self._owns_driver = driver is None
+        self._finalizer = None
+        self._network_configured = False
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def initialize_driver(self):
+        """Initialize headless Chrome browser using the system chromedriver."""
+        try:
+            self.driver = launch_driver()
+            self._owns_driver = True
+            # Safety net if the handler is dropped without close()
+            self._finalizer = weakref.finalize(self, _shutdown_driver, self.driver)
             return True
 
         except Exception:
@@ -63,27 +400,46 @@ class BrowserHandler:
             self.driver = None
             return False
 
+    def _ensure_driver(self):
+        """Make sure a driver exists and has this handler's network settings"""
+        if not self.driver and not self.initialize_driver():
+            return False
+        if not self._network_configured:
+            self._configure_network()
+        return True
+
+    def _configure_network(self):
+        """Apply (or clear, for pooled drivers) resource blocking via CDP"""
+        urls = BLOCKED_RESOURCE_PATTERNS if self.block_resources else []
+        try:
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": urls})
+        except Exception:
+            logger.warning("Could not configure resource blocking", exc_info=True)
+        self._network_configured = True
+
     def fetch_page_content(self, url, wait_time=5):
         """
         Fetch content from a JavaScript-rendered page
         
         Args:
             url: URL to fetch
-            wait_time: Time to wait for page to load (seconds)
+            wait_time: Extra seconds allowed for the page to finish loading
         
         Returns:
             Rendered HTML content
         """
         try:
-            if not self.driver:
-                if not self.initialize_driver():
-                    return None
+            if not self._ensure_driver():
+                return None
             
             logger.info(f"Fetching URL: {url}")
             self.driver.get(url)
             
-            # Wait for page to load
-            time.sleep(wait_time)
+            # Wait for page to load (returns as soon as it is ready)
+            WebDriverWait(self.driver, wait_time + 10).until(
+                lambda d: d.execute_script("return document.readyState") == "complete"
+            )
             
             # Wait for result div if it exists
             try:
@@ -108,54 +464,93 @@ class BrowserHandler:
         Get text content from a specific element. Falls back to parsing page_source.
         """
         try:
-            if not self.driver:
-                if not self.initialize_driver():
-                    return None
+            if not self._ensure_driver():
+                return None
     
             logger.info(f"Fetching text from {url} with selector {selector}")
             self.driver.get(url)
-    
-            try:
-                element = WebDriverWait(self.driver, wait_seconds).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                )
-                text_content = element.text
-                logger.info("Text content extracted successfully (by selector)")
-                return text_content
-    
-            except TimeoutException:
-                logger.warning("Selector %s not found after %s seconds — falling back to page_source", selector, wait_seconds)
-                # Option A: try a few common fallback selectors
-                for alt in ["#result", ".result", ".content", "body"]:
-                    try:
-                        el = self.driver.find_element(By.CSS_SELECTOR, alt)
-                        logger.info("Found content with fallback selector %s", alt)
-                        return el.text
-                    except Exception:
-                        pass
-    
-                # Option B: parse page_source with BeautifulSoup
-                page = self.driver.page_source
-                soup = BeautifulSoup(page, "html.parser")
-    
-                # try to extract main text: look for main/article/div with text
-                candidates = soup.select("main, article, .content, #content, body, div")
-                for c in candidates:
-                    text = c.get_text(separator="\n", strip=True)
-                    if text and len(text) > 20:  # adjust threshold as needed
-                        logger.info("Extracted text from page_source fallback (len=%s)", len(text))
-                        return text
-    
-                logger.warning("No usable text found in fallback parsing")
-                return None
+            return self._extract_text(selector, wait_seconds)
     
         except Exception:
             logger.exception("Error getting text content")
             return None
+    
+    def fetch_and_extract(self, url, selector="#result", wait_seconds=10):
+        """
+        Load a page once and return its element text, plus HTML only if needed
+        
+        Args:
+            url: URL to fetch
+            selector: CSS selector of the element holding the content
+            wait_seconds: Seconds to wait for the selector to appear
+        
+        Returns:
+            Tuple of (text, html). html is only read from the driver when no
+            text could be extracted; both are None if navigation failed.
+        """
+        try:
+            if not self._ensure_driver():
+                return None, None
+    
+            logger.info(f"Fetching {url} and extracting {selector}")
+            self.driver.get(url)
+    
+            text = self._extract_text(selector, wait_seconds)
+            if text:
+                return text, None
+    
+            return None, self.driver.page_source
+    
+        except Exception:
+            logger.exception("Error fetching and extracting page")
+            return None, None
+    
+    def _extract_text(self, selector, wait_seconds):
+        """Extract text from the currently loaded page, without navigating"""
+        try:
+            element = WebDriverWait(self.driver, wait_seconds).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, selector))
+            )
+            text_content = element.text
+            logger.info("Text content extracted successfully (by selector)")
+            return text_content
+    
+        except TimeoutException:
+            logger.warning("Selector %s not found after %s seconds — falling back to page_source", selector, wait_seconds)
+            # Option A: try common fallback selectors in the page itself,
+            # so only the matching element's text crosses the driver bridge
+            text = self.driver.execute_script(_FALLBACK_JS)
+            if text:
+                logger.info("Found content with in-page fallback selectors")
+                return text
+    
+            # Option B: parse page_source once with lxml and walk the
+            # precompiled container XPath
+            page = self.driver.page_source
+            tree = lxml.html.fromstring(page)
+            etree.strip_elements(tree, "script", "style", "noscript", with_tail=False)
+    
+            # try to extract main text: look for main/article/div with text
+            candidates = _FALLBACK_XPATH(tree)[:50]
+            for c in candidates:
+                text = _node_text(c)
+                if text and len(text) > 20:  # adjust threshold as needed
+                    logger.info("Extracted text from page_source fallback (len=%s)", len(text))
+                    return text
+    
+            logger.warning("No usable text found in fallback parsing")
+            return None
 
     
     def close(self):
-        """Close the browser"""
+        """Close the browser (pooled drivers are left to their pool)"""
+        self._network_configured = False
+        if not self._owns_driver:
+            self.driver = None
+            return
+        if self._finalizer:
+            self._finalizer.detach()
+            self._finalizer = None
         if self.driver:
             try:
                 self.driver.quit()
@@ -164,8 +559,4 @@ class BrowserHandler:
                 logger.exception("Error closing browser")
             finally:
                 self.driver = None
-    
-    def __del__(self):
-        """Cleanup on deletion"""
-        self.close()
 
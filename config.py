@@ -1,27 +1,47 @@
 # Configuration file for deployment
 
 import os
+from typing import NamedTuple, Optional
 
-class Config:
-    """Base configuration"""
-    SECRET_KEY = os.getenv('SECRET_KEY', 'default-secret-key')
-    STUDENT_EMAIL = os.getenv('STUDENT_EMAIL')
-    OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-    DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
-    PORT = int(os.getenv('PORT', 5000))
-    HOST = os.getenv('HOST', '0.0.0.0')
+# Only touch python-dotenv when there is a .env file next to this module,
+# wherever the process was started from
+_ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+if os.path.exists(_ENV_FILE):
+    from dotenv import load_dotenv
+    load_dotenv(_ENV_FILE)
 
-class DevelopmentConfig(Config):
-    """Development configuration"""
-    DEBUG = True
+class Settings(NamedTuple):
+    """Process-wide settings, read once at import"""
+    SECRET_KEY: Optional[str]
+    STUDENT_EMAIL: Optional[str]
+    GROQ_API_KEY: Optional[str]
+    OPENAI_API_KEY: Optional[str]
+    DEBUG: bool
+    PORT: int
+    HOST: str
+    BROWSER_POOL_SIZE: int
+    BROWSER_POOL_TIMEOUT: int
+    BROWSER_POOL_RECYCLE_AFTER: int
+    BROWSER_POOL_MIN_READY: int
+    QUIZ_WORKERS: int
 
-class ProductionConfig(Config):
-    """Production configuration"""
-    DEBUG = False
+# CPUs this process may actually run on; os.cpu_count() reports the whole host
+# inside containers. Capped at 4 to match the Dockerfile's default thread count.
+_cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+_pool_size = int(os.getenv('BROWSER_POOL_SIZE', min(4, _cpus)))
 
-# Config dictionary
-config = {
-    'development': DevelopmentConfig,
-    'production': ProductionConfig,
-    'default': DevelopmentConfig
-}
+CONFIG = Settings(
+    SECRET_KEY=os.getenv('SECRET_KEY'),
+    STUDENT_EMAIL=os.getenv('STUDENT_EMAIL'),
+    GROQ_API_KEY=os.getenv('GROQ_API_KEY'),
+    OPENAI_API_KEY=os.getenv('OPENAI_API_KEY'),
+    DEBUG=os.getenv('DEBUG', 'False').lower() == 'true',
+    PORT=int(os.getenv('PORT', 5000)),
+    HOST=os.getenv('HOST', '0.0.0.0'),
+    BROWSER_POOL_SIZE=_pool_size,
+    BROWSER_POOL_TIMEOUT=int(os.getenv('BROWSER_POOL_TIMEOUT', 60)),
+    BROWSER_POOL_RECYCLE_AFTER=int(os.getenv('BROWSER_POOL_RECYCLE_AFTER', 20)),
+    # Browsers needed before /ready reports the instance as able to take quizzes
+    BROWSER_POOL_MIN_READY=min(int(os.getenv('BROWSER_POOL_MIN_READY', 1)), _pool_size),
+    QUIZ_WORKERS=int(os.getenv('QUIZ_WORKERS', _pool_size)),
+)
@@ -1,23 +1,107 @@
-import pandas as pd
-import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import io
 import logging
-from bs4 import BeautifulSoup
-import PyPDF2
 import base64
+import hashlib
 import json
+import orjson
+import os
 import re
+import tempfile
+from email.message import Message
 from pathlib import Path
+from urllib.parse import unquote, urlparse
 
 logger = logging.getLogger(__name__)
 
+# Last-resort filename match for Content-Disposition headers email.message can't parse
+_CD_RE = re.compile(r'filename="?([^";]+)"?')
+_HTTP_PREFIXES = ('http://', 'https://')
+# orjson only handles 64-bit integers; longer digit runs go through stdlib json
+_LONG_DIGITS_RE = re.compile(r'\d{19,}')
+
+
+def json_loads(data):
+    """
+    Parse JSON with orjson, keeping integers beyond 64 bits exact
+    
+    orjson silently turns such integers into floats, so text containing a
+    long digit run is parsed with the stdlib json module instead.
+    """
+    text = data.decode('utf-8') if isinstance(data, (bytes, bytearray)) else data
+    if _LONG_DIGITS_RE.search(text):
+        return json.loads(text)
+    return orjson.loads(text)
+
+
+def json_dumps(obj, indent=False):
+    """
+    Serialize to JSON bytes with orjson, falling back to stdlib json for
+    values orjson rejects (integers beyond 64 bits)
+    """
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    except TypeError:
+        return json.dumps(obj, indent=2 if indent else None).encode('utf-8')
+
+
+def write_atomic(path, data):
+    """
+    Write text or bytes so readers only ever see the old or the complete new file
+    
+    The data goes to a temporary file in the same directory, which is then
+    renamed over path; concurrent quiz chains may share the cache directories.
+    """
+    path = Path(path)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
 class DataProcessor:
-    """Handles data sourcing, processing, and analysis"""
+    """
+    Handles data sourcing, processing, and analysis
+    
+    Heavy parsing libraries (pandas, PyMuPDF, lxml.html, matplotlib) are
+    imported inside the methods that use them, so quizzes that never touch a
+    file don't pay for them.
+    """
     
     def __init__(self):
         self.download_dir = Path("downloads")
         self.download_dir.mkdir(exist_ok=True)
+        self.cache_dir = self.download_dir / ".cache"
+        self.cache_dir.mkdir(exist_ok=True)
+        
+        # Keep-alive connection pool reused for every HTTP call in a quiz chain
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3)
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    @staticmethod
+    def preload():
+        """Import all parsing libraries up front, for callers that know they'll need them"""
+        import pandas
+        import pymupdf
+        import lxml.html
+        import matplotlib.figure
     
     def download_file(self, url, filename=None):
         """
@@ -32,22 +116,86 @@ class DataProcessor:
         """
         try:
             logger.info(f"Downloading file from: {url}")
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
             
-            if not filename:
-                # Extract filename from URL or Content-Disposition
-                if 'Content-Disposition' in response.headers:
-                    cd = response.headers['Content-Disposition']
-                    filename = re.findall('filename="?(.+)"?', cd)
-                    filename = filename[0] if filename else 'download'
-                else:
-                    filename = url.split('/')[-1] or 'download'
+            # Revalidate a previous download of this URL instead of re-fetching it
+            url_key = self._digest(url.encode())
+            meta_path = self.cache_dir / f"{url_key}.json"
+            meta = None
+            headers = {}
+            if not filename and meta_path.exists():
+                try:
+                    meta = json.loads(meta_path.read_text())
+                    cached = Path(meta['path'])
+                    # Another URL may have saved over the same filename since
+                    fresh = cached.exists() and self._file_digest(cached) == meta['digest']
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    # A damaged entry is just a cache miss: fetch the file again
+                    logger.warning(f"Ignoring unreadable download cache entry: {str(e)}")
+                    fresh = False
+                if fresh:
+                    if meta.get('etag'):
+                        headers['If-None-Match'] = meta['etag']
+                    if meta.get('last_modified'):
+                        headers['If-Modified-Since'] = meta['last_modified']
             
-            filepath = self.download_dir / filename
-            filepath.write_bytes(response.content)
-            logger.info(f"File downloaded to: {filepath}")
-            return filepath
+            with self.session.get(url, headers=headers, timeout=30, stream=True) as response:
+                if response.status_code == 304 and headers:
+                    logger.info(f"File unchanged, using cached copy: {meta['path']}")
+                    return Path(meta['path'])
+                response.raise_for_status()
+                
+                if not filename:
+                    # Extract filename from Content-Disposition or the final URL
+                    if 'Content-Disposition' in response.headers:
+                        # RFC 2183/2231 parsing, including filename*=UTF-8''... forms
+                        msg = Message()
+                        msg['content-disposition'] = response.headers['Content-Disposition']
+                        filename = msg.get_filename()
+                        if not filename:
+                            match = _CD_RE.search(response.headers['Content-Disposition'])
+                            filename = match.group(1) if match else ''
+                        # Keep only the final path component of server-supplied names
+                        filename = Path(filename).name or 'download'
+                    else:
+                        # response.url is the post-redirect URL; its path drops
+                        # any query string that would mangle the file suffix
+                        filename = Path(unquote(urlparse(response.url).path)).name or 'download'
+                    # Different URLs often share a name (/data?id=1 vs /data?id=2),
+                    # so every URL gets its own file; the suffix stays intact
+                    filename = f"{url_key[:12]}-{filename}"
+                
+                # Stream to disk in 1 MiB chunks (gzip decoded on the fly) so
+                # large files never sit in memory whole. The temporary file is
+                # renamed into place at the end, so a concurrent download of the
+                # same URL can never leave another thread parsing a partial file.
+                filepath = self.download_dir / filename
+                content_hash = hashlib.blake2b(digest_size=16)
+                fd, tmp = tempfile.mkstemp(dir=self.download_dir, prefix=f".{filepath.name}.", suffix=".part")
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=1 << 20):
+                            f.write(chunk)
+                            content_hash.update(chunk)
+                    os.replace(tmp, filepath)
+                except BaseException:
+                    try:
+                        os.unlink(tmp)
+                    except OSError:
+                        pass
+                    raise
+                logger.info(f"File downloaded to: {filepath}")
+                
+                # Remember validators so the next request for this URL can be a 304
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                if etag or last_modified:
+                    write_atomic(meta_path, json.dumps({
+                        'path': str(filepath),
+                        'digest': content_hash.hexdigest(),
+                        'etag': etag,
+                        'last_modified': last_modified
+                    }))
+                return filepath
         
         except Exception as e:
             logger.error(f"Error downloading file: {str(e)}")
@@ -67,46 +215,106 @@ class DataProcessor:
         try:
             logger.info(f"Reading PDF: {filepath}")
             
-            # Try to extract tables using tabula
-            try:
-                import tabula
-                if page_num:
-                    tables = tabula.read_pdf(str(filepath), pages=page_num)
-                else:
-                    tables = tabula.read_pdf(str(filepath), pages='all')
+            # Text extracted earlier from identical bytes is reused as-is
+            cache_path = self.cache_dir / f"{self._file_digest(filepath)}-{page_num or 'all'}.txt"
+            if cache_path.exists():
+                logger.info("PDF text loaded from cache")
+                return cache_path.read_text(encoding='utf-8')
+            
+            import pymupdf
+            
+            with pymupdf.open(str(filepath)) as doc:
+                pages = [doc[page_num - 1]] if page_num else list(doc)  # Convert to 0-indexed
                 
+                # Try to extract tables from the already-open document
+                tables = self._extract_pdf_tables(filepath, pages, page_num)
                 if tables:
                     logger.info(f"Extracted {len(tables)} table(s) from PDF")
                     return tables
-            except Exception as e:
-                logger.warning(f"Tabula extraction failed: {str(e)}")
-            
-            # Fallback to text extraction
-            with open(filepath, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text_content = []
                 
-                if page_num:
-                    page = pdf_reader.pages[page_num - 1]  # Convert to 0-indexed
-                    text_content.append(page.extract_text())
-                else:
-                    for page in pdf_reader.pages:
-                        text_content.append(page.extract_text())
+                # Fallback to text extraction
+                text_content = [page.get_text() for page in pages]
                 
                 logger.info("PDF text extracted")
-                return '\n'.join(text_content)
+                text = '\n'.join(text_content)
+                write_atomic(cache_path, text)
+                return text
         
         except Exception as e:
             logger.error(f"Error reading PDF: {str(e)}")
             return None
     
+    def _extract_pdf_tables(self, filepath, pages, page_num):
+        """
+        Extract tables with MuPDF's table finder, falling back to pdfplumber
+        (when installed) if MuPDF finds none
+        
+        Returns:
+            List of DataFrames (empty if no tables were found)
+        """
+        tables = []
+        try:
+            for page in pages:
+                for table in page.find_tables().tables:
+                    tables.append(table.to_pandas())
+        except Exception as e:
+            logger.warning(f"PyMuPDF table extraction failed: {str(e)}")
+        
+        if tables:
+            return tables
+        
+        try:
+            import pdfplumber
+            import pandas as pd
+        except ImportError:
+            return tables
+        
+        try:
+            with pdfplumber.open(str(filepath)) as pdf:
+                plumber_pages = [pdf.pages[page_num - 1]] if page_num else pdf.pages
+                for page in plumber_pages:
+                    for rows in page.extract_tables():
+                        if rows:
+                            tables.append(pd.DataFrame(rows[1:], columns=rows[0]))
+        except Exception as e:
+            logger.warning(f"pdfplumber table extraction failed: {str(e)}")
+        
+        return tables
+    
+    @staticmethod
+    def _digest(data):
+        """Short blake2b hex digest used for cache keys"""
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+    
+    @staticmethod
+    def _file_digest(filepath):
+        """blake2b hex digest of a file's contents, read in 1 MiB chunks"""
+        h = hashlib.blake2b(digest_size=16)
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+    
     def read_csv(self, filepath_or_url):
         """Read CSV file or URL into DataFrame"""
         try:
-            if isinstance(filepath_or_url, str) and filepath_or_url.startswith('http'):
-                df = pd.read_csv(filepath_or_url)
-            else:
-                df = pd.read_csv(filepath_or_url)
+            import pandas as pd
+            
+            source = filepath_or_url
+            if isinstance(filepath_or_url, str) and filepath_or_url.startswith(_HTTP_PREFIXES):
+                # Fetch over the pooled session rather than letting pandas open its own connection
+                response = self.session.get(filepath_or_url, timeout=30)
+                response.raise_for_status()
+                source = io.BytesIO(response.content)
+            
+            try:
+                # Arrow's multi-threaded C++ reader
+                df = pd.read_csv(source, engine='pyarrow', dtype_backend='pyarrow')
+            except Exception as e:
+                logger.warning(f"pyarrow CSV reader unavailable or failed, using default parser: {str(e)}")
+                if isinstance(source, io.BytesIO):
+                    source.seek(0)
+                df = pd.read_csv(source)
             
             logger.info(f"CSV loaded: {df.shape[0]} rows, {df.shape[1]} columns")
             return df
@@ -117,6 +325,8 @@ class DataProcessor:
     def read_excel(self, filepath, sheet_name=0):
         """Read Excel file into DataFrame"""
         try:
+            import pandas as pd
+            
             df = pd.read_excel(filepath, sheet_name=sheet_name)
             logger.info(f"Excel loaded: {df.shape[0]} rows, {df.shape[1]} columns")
             return df
@@ -135,25 +345,31 @@ class DataProcessor:
             Dictionary with text and structured data
         """
         try:
+            import pandas as pd
+            from lxml import etree, html as lxml_html
+            
             logger.info(f"Scraping webpage: {url}")
-            response = requests.get(url, timeout=30)
+            response = self.session.get(url, timeout=30)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            tree = lxml_html.fromstring(response.content)
+            links = [str(href) for href in tree.xpath('//a/@href')]
             
-            # Extract text
-            text = soup.get_text(separator='\n', strip=True)
+            # Extract visible text; script/style bodies are not page text
+            etree.strip_elements(tree, 'script', 'style', 'noscript', with_tail=False)
+            text = '\n'.join(s for s in (t.strip() for t in tree.itertext()) if s)
             
-            # Extract tables
-            tables = []
-            for table in soup.find_all('table'):
-                df = pd.read_html(str(table))[0]
-                tables.append(df)
+            # Extract all tables in a single lxml parse of the raw page
+            try:
+                tables = pd.read_html(io.BytesIO(response.content), flavor='lxml')
+            except ValueError:
+                # pandas raises ValueError when the page has no tables
+                tables = []
             
             result = {
                 'text': text,
                 'tables': tables,
-                'links': [a.get('href') for a in soup.find_all('a', href=True)]
+                'links': links
             }
             
             logger.info("Webpage scraped successfully")
@@ -213,9 +429,12 @@ class DataProcessor:
             Base64 encoded image
         """
         try:
-            import matplotlib.pyplot as plt
+            # A bare Figure renders on Agg without pyplot's global figure
+            # registry, which is also not safe across quiz worker threads
+            from matplotlib.figure import Figure
             
-            fig, ax = plt.subplots(figsize=(10, 6))
+            fig = Figure(figsize=(10, 6))
+            ax = fig.subplots()
             
             if viz_type == 'bar':
                 df.plot(kind='bar', ax=ax)
@@ -226,13 +445,12 @@ class DataProcessor:
             else:
                 df.plot(ax=ax)
             
-            plt.tight_layout()
+            fig.tight_layout()
             
-            # Save to bytes
+            # Save to bytes; fast zlib level, the payload is base64'd immediately
             buf = io.BytesIO()
-            plt.savefig(buf, format='png')
+            fig.savefig(buf, format='png', dpi=96, pil_kwargs={'compress_level': 1})
             buf.seek(0)
-            plt.close()
             
             # Encode to base64
             img_base64 = base64.b64encode(buf.read()).decode('utf-8')
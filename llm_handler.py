@@ -1,19 +1,24 @@
-import os
 import logging
+import hashlib
+import os
+import orjson
+from pathlib import Path
 from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
+from config import CONFIG
+from data_processor import write_atomic, json_dumps, json_loads
 
 logger = logging.getLogger(__name__)
 
+# Least recently used entries beyond this are pruned from the LLM cache
+LLM_CACHE_MAX_ENTRIES = 256
+
 class LLMHandler:
     """Handles interactions with LLM (OpenAI or Groq)"""
     
     def __init__(self):
         # Check for Groq API key first, fallback to OpenAI
-        groq_key = os.getenv('GROQ_API_KEY')
-        openai_key = os.getenv('OPENAI_API_KEY')
+        groq_key = CONFIG.GROQ_API_KEY
+        openai_key = CONFIG.OPENAI_API_KEY
         
         if groq_key:
             # Use Groq (free tier available)
@@ -33,24 +38,86 @@ class LLMHandler:
         else:
             logger.error("Neither GROQ_API_KEY nor OPENAI_API_KEY found in environment variables")
             raise ValueError("GROQ_API_KEY or OPENAI_API_KEY is required")
+        
+        self.cache_dir = Path("downloads") / ".llm_cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
     
-    def analyze_quiz(self, quiz_content):
+    def _complete(self, messages, temperature=None, store=True, **kwargs):
         """
-        Analyze quiz content and extract the task
-        
-        Args:
-            quiz_content: HTML or text content of the quiz
+        Run a chat completion and return the message content
         
-        Returns:
-            Dictionary with task analysis
+        Deterministic calls (temperature 0) are cached on disk, keyed by a hash
+        of the model and the full request, so retried quizzes skip the round-trip.
+        With store=False a cached response is still used, but a fresh one is
+        not written; the caller stores it later with _store() once it is known
+        to be good.
         """
-        try:
-            prompt = f"""Analyze this quiz content and extract:
+        params = self._request_params(messages, temperature, **kwargs)
+        
+        cache_path = None
+        if temperature == 0:
+            cache_path = self._cache_path(params)
+            try:
+                content = cache_path.read_text(encoding='utf-8')
+                os.utime(cache_path)  # Mark as recently used for pruning
+            except OSError:
+                content = None
+            if content:
+                logger.info("LLM response loaded from cache")
+                return content
+        
+        response = self.client.chat.completions.create(**params)
+        content = response.choices[0].message.content
+        
+        if cache_path and store and content:
+            self._store(cache_path, content)
+        return content
+    
+    def _store(self, cache_path, content):
+        """Write one cache entry, then prune the least recently used beyond the cap"""
+        # Atomic, so a concurrent chain on the same quiz never reads half a file
+        write_atomic(cache_path, content)
+        
+        entries = list(self.cache_dir.glob("*.txt"))
+        if len(entries) <= LLM_CACHE_MAX_ENTRIES:
+            return
+        
+        def mtime(path):
+            try:
+                return path.stat().st_mtime
+            except OSError:
+                return 0
+        
+        entries.sort(key=mtime)
+        for path in entries[:len(entries) - LLM_CACHE_MAX_ENTRIES]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+    
+    def _request_params(self, messages, temperature=None, **kwargs):
+        """Full chat completion request; also what the cache key is hashed from"""
+        params = {"model": self.model, "messages": messages, **kwargs}
+        if temperature is not None:
+            params["temperature"] = temperature
+        return params
+    
+    def _cache_path(self, params):
+        key = hashlib.blake2b(
+            orjson.dumps(params, option=orjson.OPT_SORT_KEYS), digest_size=16
+        ).hexdigest()
+        return self.cache_dir / f"{key}.txt"
+    
+    def _analysis_request(self, quiz_content):
+        """Messages and options analyze_quiz sends for quiz_content"""
+        prompt = f"""Analyze this quiz content and extract:
 1. The main task/question
 2. Any URLs or files to download
 3. The submit URL
 4. The expected answer format (boolean, number, string, file, JSON object)
 5. Step-by-step instructions to solve it
+6. If the task can be answered from the quiz content alone (nothing to download),
+   a brief solution and the final answer value in the expected format; otherwise null for both
 
 Quiz content:
 {quiz_content}
@@ -61,21 +128,48 @@ Respond in JSON format:
     "download_urls": ["url1", "url2"],
     "submit_url": "submission endpoint",
     "answer_format": "type of answer expected",
-    "steps": ["step1", "step2", ...]
+    "steps": ["step1", "step2", ...],
+    "solution": "brief working" or null,
+    "final_answer": "the answer value only" or null
 }}
 """
+        return {
+            "messages": [
+                {"role": "system", "content": "You are a helpful assistant that analyzes quiz tasks and extracts structured information."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0,  # Extraction, not generation: deterministic and cacheable
+            "response_format": {"type": "json_object"}
+        }
+    
+    def remember_analysis(self, quiz_content, analysis):
+        """
+        Cache the analysis of a quiz whose answer the server judged correct
+        
+        The analysis can carry the final answer, so analyze_quiz never caches
+        it on its own: a bad analysis (wrong answer, unusable submit URL, a
+        failed submit) must be re-asked on the next attempt, not replayed.
+        """
+        try:
+            params = self._request_params(**self._analysis_request(quiz_content))
+            self._store(self._cache_path(params), json_dumps(analysis).decode())
+        except Exception as e:
+            logger.warning(f"Could not cache quiz analysis: {str(e)}")
+    
+    def analyze_quiz(self, quiz_content):
+        """
+        Analyze quiz content and extract the task
+        
+        Args:
+            quiz_content: HTML or text content of the quiz
+        
+        Returns:
+            Dictionary with task analysis
+        """
+        try:
+            content = self._complete(**self._analysis_request(quiz_content), store=False)
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that analyzes quiz tasks and extracts structured information."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"}
-            )
-            
-            import json
-            result = json.loads(response.choices[0].message.content)
+            result = json_loads(content)
             logger.info("Quiz analysis completed successfully")
             return result
         
@@ -83,16 +177,17 @@ Respond in JSON format:
             logger.error(f"Error analyzing quiz: {str(e)}")
             return None
     
-    def solve_task(self, task_description, data_context):
+    def solve_and_extract(self, task_description, data_context, expected_format):
         """
-        Use LLM to solve a specific task
+        Solve a task and extract its final answer in a single LLM call
         
         Args:
             task_description: Description of the task
             data_context: Any data or context needed
+            expected_format: Expected format (number, string, boolean, etc.)
         
         Returns:
-            Solution to the task
+            Tuple of (solution text, formatted answer)
         """
         try:
             prompt = f"""Task: {task_description}
@@ -100,83 +195,69 @@ Respond in JSON format:
 Data/Context:
 {data_context}
 
-Provide the answer directly. If it's a calculation, show your work briefly then give the final answer.
-If it requires data analysis, describe your approach and provide the result.
+Solve the task. If it's a calculation, show your work briefly.
+If it requires data analysis, describe your approach briefly.
+Then give the final answer formatted as {expected_format}:
+for numbers just the number, for strings just the string without quotes,
+for booleans true or false, for JSON the JSON object.
+
+Respond in JSON format:
+{{
+    "solution": "brief working",
+    "final_answer": "the answer value only"
+}}
 """
             
-            response = self.client.chat.completions.create(
-                model=self.model,
+            content = self._complete(
                 messages=[
-                    {"role": "system", "content": "You are an expert data analyst. Provide accurate, concise answers."},
+                    {"role": "system", "content": "You are an expert data analyst. Provide accurate, concise answers and format them precisely."},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.1  # Low temperature for consistency
+                # Answers are never cached: a wrong one must not be replayed on retry
+                temperature=0.1,
+                response_format={"type": "json_object"}
             )
             
-            solution = response.choices[0].message.content
+            result = json_loads(content)
             logger.info("Task solution generated")
-            return solution
+            return result.get('solution'), self.format_answer(result.get('final_answer'), expected_format)
         
         except Exception as e:
             logger.error(f"Error solving task: {str(e)}")
-            return None
+            return None, None
     
-    def extract_answer(self, solution, expected_format):
+    def format_answer(self, answer, expected_format):
         """
-        Extract the final answer from the solution
+        Convert an answer value to the expected format
         
         Args:
-            solution: LLM's solution text
+            answer: Answer value from the LLM (already typed, or a string)
             expected_format: Expected format (number, string, boolean, etc.)
         
         Returns:
             Formatted answer
         """
-        try:
-            prompt = f"""Extract the final answer from this solution and format it as {expected_format}.
-
-Solution:
-{solution}
-
-Return ONLY the answer value, nothing else. No explanation.
-For numbers, return just the number.
-For strings, return just the string without quotes.
-For booleans, return true or false.
-For JSON, return the JSON object.
-"""
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You extract and format answers precisely."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0
-            )
-            
-            answer = response.choices[0].message.content.strip()
-            
-            # Try to convert to appropriate type
-            if expected_format == "number":
-                try:
-                    # Try int first, then float
-                    if '.' in answer:
-                        return float(answer)
-                    else:
-                        return int(answer)
-                except:
-                    return answer
-            elif expected_format == "boolean":
-                return answer.lower() in ['true', 'yes', '1']
-            elif expected_format in ["json", "object"]:
-                import json
-                try:
-                    return json.loads(answer)
-                except:
-                    return answer
-            
+        if not isinstance(answer, str):
             return answer
         
-        except Exception as e:
-            logger.error(f"Error extracting answer: {str(e)}")
-            return solution  # Return original solution as fallback
+        answer = answer.strip()
+        
+        # Try to convert to appropriate type
+        if expected_format == "number":
+            try:
+                # Try int first, then float
+                if '.' in answer:
+                    return float(answer)
+                else:
+                    return int(answer)
+            except:
+                return answer
+        elif expected_format == "boolean":
+            return answer.lower() in ['true', 'yes', '1']
+        elif expected_format in ["json", "object"]:
+            try:
+                return json_loads(answer)
+            except:
+                return answer
+        
+        return answer
@@ -1,16 +1,19 @@
 import logging
-import requests
 import time
-from datetime import datetime, timedelta
 from browser_handler import BrowserHandler
 from llm_handler import LLMHandler
-from data_processor import DataProcessor
-import json
-from bs4 import BeautifulSoup
+from data_processor import DataProcessor, json_dumps, json_loads
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin, urlparse
 
 logger = logging.getLogger(__name__)
 
+# Placeholder strings the LLM sometimes returns instead of a JSON null
+_MISSING_ANSWERS = frozenset({'', 'null', 'none'})
+
+# Frames longer than this are sent to the LLM as head + tail + column summary
+PROMPT_MAX_ROWS = 100
+
 def make_absolute_submit_url(page_url: str, raw_submit: str) -> str:
     """
     Resolve a raw submit URL (possibly relative) to an absolute URL using page_url as base.
@@ -49,38 +52,78 @@ def make_absolute_submit_url(page_url: str, raw_submit: str) -> str:
     return abs_url
 
 class QuizSolver:
-    """Main class for solving quiz tasks"""
+    """
+    Main class for solving quiz tasks.
+
+    One instance is shared by every worker thread: all per-run state (browser,
+    start time) is passed between methods rather than stored on self.
+    """
     
-    def __init__(self, email, secret):
+    def __init__(self, email, secret, browser_pool):
         self.email = email
         self.secret = secret
-        self.browser = BrowserHandler()
+        self.browser_pool = browser_pool
         self.llm = LLMHandler()
         self.data_processor = DataProcessor()
-        self.start_time = None
-        self.time_limit = timedelta(minutes=3)
+        # Submissions share the data processor's keep-alive pool
+        self.session = self.data_processor.session
+        self.time_limit = 180.0  # seconds per quiz chain
     
-    def solve_quiz_chain(self, initial_url):
+    def solve_quiz_chain(self, initial_url, deadline=None):
         """
         Solve a chain of quizzes starting from initial URL
         
         Args:
             initial_url: The first quiz URL to solve
+            deadline: time.monotonic() value the chain must finish by. Callers
+                      that queue the chain set it when the quiz arrives, so
+                      time spent waiting for a worker counts against the limit.
         """
-        self.start_time = datetime.now()
-        current_url = initial_url
-        quiz_count = 0
+        # Monotonic clock: immune to wall-clock (NTP) jumps
+        start_time = time.monotonic()
+        if deadline is None:
+            deadline = start_time + self.time_limit
+        
+        if start_time >= deadline:
+            logger.warning(f"Quiz chain for {initial_url} expired while queued, skipping it")
+            return
         
         logger.info(f"Starting quiz chain from: {initial_url}")
         
-        while current_url and self._within_time_limit():
+        try:
+            with self.browser_pool.acquire() as driver, BrowserHandler(driver) as browser:
+                quiz_count = self._run_chain(initial_url, browser, deadline)
+        except Exception as e:
+            logger.error(f"Quiz chain aborted: {str(e)}", exc_info=True)
+            return
+        
+        elapsed = time.monotonic() - start_time
+        logger.info(f"\nQuiz session completed. Total time: {elapsed:.2f}s")
+        logger.info(f"Quizzes attempted: {quiz_count}")
+    
+    def _run_chain(self, initial_url, browser, deadline):
+        """
+        Follow the quiz chain until it ends or the time limit is hit
+        
+        Args:
+            initial_url: The first quiz URL to solve
+            browser: BrowserHandler used for every page in the chain
+            deadline: time.monotonic() value after which no new quiz is started
+        
+        Returns:
+            Number of quizzes attempted
+        """
+        current_url = initial_url
+        quiz_count = 0
+        
+        while current_url and self._within_time_limit(deadline):
             quiz_count += 1
             logger.info(f"\n{'='*50}")
             logger.info(f"Solving Quiz #{quiz_count}: {current_url}")
             logger.info(f"{'='*50}")
             
             # Solve the current quiz
-            result = self.solve_single_quiz(current_url)
+            result = self.solve_single_quiz(current_url, browser)
             
             if not result:
                 logger.error(f"Failed to solve quiz at {current_url}")
@@ -107,39 +150,34 @@ class QuizSolver:
                     logger.info("No new URL provided, quiz chain ended")
                     break
         
-        elapsed = datetime.now() - self.start_time
-        logger.info(f"\nQuiz session completed. Total time: {elapsed.total_seconds():.2f}s")
-        logger.info(f"Quizzes attempted: {quiz_count}")
-        
-        # Cleanup
-        self.browser.close()
+        return quiz_count
     
-    def solve_single_quiz(self, quiz_url):
+    def solve_single_quiz(self, quiz_url, browser):
         """
         Solve a single quiz
         
         Args:
             quiz_url: URL of the quiz to solve
+            browser: BrowserHandler to render the quiz page with
         
         Returns:
             Result dictionary from submission
         """
         try:
-            # Step 1: Fetch quiz content using headless browser
+            # Step 1: Load the quiz page once and extract the result div's text
             logger.info("Step 1: Fetching quiz page...")
-            page_content = self.browser.fetch_page_content(quiz_url)
+            text_content, page_content = browser.fetch_and_extract(quiz_url, "#result")
             
-            if not page_content:
+            if not text_content and not page_content:
                 logger.error("Failed to fetch page content")
                 return None
             
-            # Step 2: Extract text from the result div
-            text_content = self.browser.get_text_content(quiz_url, "#result")
+            # Step 2: Only parse the HTML when the browser found no text
             if not text_content:
-                # Fallback to parsing HTML
-                soup = BeautifulSoup(page_content, 'html.parser')
-                result_div = soup.find(id='result')
-                text_content = result_div.get_text(strip=True) if result_div else page_content
+                from bs4 import BeautifulSoup, SoupStrainer
+                # Only build the #result subtree, not the whole page's DOM
+                soup = BeautifulSoup(page_content, 'lxml', parse_only=SoupStrainer(id='result'))
+                text_content = soup.get_text(strip=True) or page_content
             
             logger.info(f"Quiz content extracted (length: {len(text_content)} chars)")
             logger.info(f"Quiz content preview:\n{text_content[:500]}...")
@@ -156,30 +194,32 @@ class QuizSolver:
             logger.info(f"Submit URL: {analysis.get('submit_url', 'Unknown')}")
             logger.info(f"Answer format: {analysis.get('answer_format', 'Unknown')}")
             
-            # Step 4: Process any required data
-            logger.info("Step 3: Processing data...")
-            data_context = self._process_data_requirements(analysis)
-            
-            # Step 5: Solve the task
-            logger.info("Step 4: Solving the task...")
-            solution = self.llm.solve_task(
-                analysis.get('task', ''),
-                data_context
-            )
+            answer_format = analysis.get('answer_format', 'string')
             
-            logger.info(f"Solution: {solution}")
-            
-            # Step 6: Extract and format the answer
-            logger.info("Step 5: Extracting final answer...")
-            answer = self.llm.extract_answer(
-                solution,
-                analysis.get('answer_format', 'string')
-            )
+            if not analysis.get('download_urls') and self._has_answer(analysis.get('final_answer')):
+                # Answerable from the page alone: the analysis call already solved it
+                logger.info("Step 3: Answer taken from quiz analysis, no data needed")
+                logger.info(f"Solution: {analysis.get('solution')}")
+                answer = self.llm.format_answer(analysis['final_answer'], answer_format)
+            else:
+                # Step 4: Process any required data
+                logger.info("Step 3: Processing data...")
+                data_context = self._process_data_requirements(analysis)
+                
+                # Step 5: Solve the task and extract the answer in one call
+                logger.info("Step 4: Solving the task and extracting the answer...")
+                solution, answer = self.llm.solve_and_extract(
+                    analysis.get('task', ''),
+                    data_context,
+                    answer_format
+                )
+                
+                logger.info(f"Solution: {solution}")
             
             logger.info(f"Final answer: {answer}")
             
-            # Step 7: Submit the answer
-            logger.info("Step 6: Submitting answer...")
+            # Step 6: Submit the answer
+            logger.info("Step 5: Submitting answer...")
             submit_url = analysis.get('submit_url')
             
             if not submit_url:
@@ -188,6 +228,10 @@ class QuizSolver:
             
             result = self._submit_answer(submit_url, quiz_url, answer)
             
+            if result and result.get('correct'):
+                # Only an analysis that led to a correct answer is worth replaying
+                self.llm.remember_analysis(text_content, analysis)
+            
             return result
         
         except Exception as e:
@@ -207,50 +251,19 @@ class QuizSolver:
         data_context = "No additional data required."
         
         try:
-            download_urls = analysis.get('download_urls', [])
+            # The same attachment listed twice would only be fetched twice in parallel
+            download_urls = list(dict.fromkeys(analysis.get('download_urls') or []))
             
             if not download_urls:
                 return data_context
             
-            all_data = []
+            # Download and parse every file concurrently: one file is parsed
+            # while the others are still downloading
+            logger.info(f"Fetching {len(download_urls)} file(s)")
+            with ThreadPoolExecutor(max_workers=min(8, len(download_urls))) as pool:
+                per_file = list(pool.map(self._load_attachment, download_urls))
             
-            for url in download_urls:
-                logger.info(f"Processing data from: {url}")
-                
-                # Download file
-                filepath = self.data_processor.download_file(url)
-                
-                if not filepath:
-                    continue
-                
-                # Process based on file type
-                file_ext = filepath.suffix.lower()
-                
-                if file_ext == '.pdf':
-                    content = self.data_processor.read_pdf(filepath)
-                    if isinstance(content, list):  # Tables
-                        for i, table in enumerate(content):
-                            all_data.append(f"Table {i+1}:\n{table.to_string()}")
-                    else:  # Text
-                        all_data.append(content)
-                
-                elif file_ext == '.csv':
-                    df = self.data_processor.read_csv(filepath)
-                    if df is not None:
-                        all_data.append(f"CSV Data:\n{df.to_string()}")
-                
-                elif file_ext in ['.xlsx', '.xls']:
-                    df = self.data_processor.read_excel(filepath)
-                    if df is not None:
-                        all_data.append(f"Excel Data:\n{df.to_string()}")
-                
-                else:
-                    # Try to read as text
-                    try:
-                        with open(filepath, 'r') as f:
-                            all_data.append(f.read())
-                    except:
-                        all_data.append(f"Binary file: {filepath.name}")
+            all_data = [item for items in per_file for item in items]
             
             if all_data:
                 data_context = "\n\n".join(all_data)
@@ -260,6 +273,95 @@ class QuizSolver:
         
         return data_context
     
+    def _load_attachment(self, url):
+        """
+        Download one file and turn it into prompt text
+        
+        Args:
+            url: URL of the file
+        
+        Returns:
+            List of text chunks for the LLM context (empty if the download failed)
+        """
+        data = []
+        
+        logger.info(f"Processing data from: {url}")
+        filepath = self.data_processor.download_file(url)
+        
+        if not filepath:
+            return data
+        
+        # Process based on file type
+        file_ext = filepath.suffix.lower()
+        
+        if file_ext == '.pdf':
+            content = self.data_processor.read_pdf(filepath)
+            if isinstance(content, list):  # Tables
+                for i, table in enumerate(content):
+                    data.append(f"Table {i+1}:\n{self._frame_to_text(table)}")
+            else:  # Text
+                data.append(content)
+        
+        elif file_ext == '.csv':
+            df = self.data_processor.read_csv(filepath)
+            if df is not None:
+                data.append(f"CSV Data:\n{self._frame_to_text(df)}")
+        
+        elif file_ext in ['.xlsx', '.xls']:
+            df = self.data_processor.read_excel(filepath)
+            if df is not None:
+                data.append(f"Excel Data:\n{self._frame_to_text(df)}")
+        
+        else:
+            # Try to read as text
+            try:
+                with open(filepath, 'r') as f:
+                    data.append(f.read())
+            except:
+                data.append(f"Binary file: {filepath.name}")
+        
+        return data
+    
+    @staticmethod
+    def _has_answer(value):
+        """True unless value is null or a null-like placeholder string"""
+        if value is None:
+            return False
+        if isinstance(value, str):
+            return value.strip().lower() not in _MISSING_ANSWERS
+        return True
+    
+    @staticmethod
+    def _frame_to_text(df):
+        """
+        Serialize a DataFrame compactly for the LLM prompt
+        
+        CSV is far cheaper in tokens than to_string()'s padded columns. Large
+        frames keep the first and last rows plus per-column totals, so
+        aggregate questions can still be answered without the full table.
+        """
+        df = df.dropna(axis=1, how='all')
+        rows = len(df)
+        
+        if rows <= PROMPT_MAX_ROWS:
+            return df.to_csv(index=False)
+        
+        half = PROMPT_MAX_ROWS // 2
+        parts = [
+            f"({rows} rows x {len(df.columns)} columns; showing first and last {half})",
+            df.head(half).to_csv(index=False),
+            f"... {rows - 2 * half} rows omitted ...",
+            df.tail(half).to_csv(index=False, header=False),
+        ]
+        
+        numeric = df.select_dtypes('number')
+        if not numeric.columns.empty:
+            summary = numeric.agg(['count', 'sum', 'mean', 'min', 'max'])
+            parts.append("Column summary over all rows:")
+            parts.append(summary.to_csv())
+        
+        return "\n".join(part.rstrip('\n') for part in parts)
+    
     def _submit_answer(self, submit_url, quiz_url, answer):
         """
         Submit answer to the quiz endpoint.
@@ -284,12 +386,14 @@ class QuizSolver:
             }
     
             logger.info(f"Submitting to: {absolute_submit}")
-            logger.info(f"Payload: {json.dumps(payload, indent=2)}")
+            # Pretty-printing is a second encode, so only pay for it when debugging
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Payload: {json_dumps(payload, indent=True).decode()}")
     
-            # Submit request
-            response = requests.post(
+            # Submit request (encode once and send the raw bytes)
+            response = self.session.post(
                 absolute_submit,
-                json=payload,
+                data=json_dumps(payload),
                 headers={'Content-Type': 'application/json'},
                 timeout=30
             )
@@ -297,8 +401,9 @@ class QuizSolver:
             logger.info(f"Response status: {response.status_code}")
     
             if response.status_code == 200:
-                result = response.json()
-                logger.info(f"Response: {json.dumps(result, indent=2)}")
+                result = json_loads(response.content)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Response: {json_dumps(result, indent=True).decode()}")
     
                 return {
                     'correct': result.get('correct', False),
@@ -313,16 +418,12 @@ class QuizSolver:
             logger.error(f"Error submitting answer: {str(e)}", exc_info=True)
             return None
     
-    def _within_time_limit(self):
-        """Check if we're still within the time limit"""
-        if not self.start_time:
-            return True
-        
-        elapsed = datetime.now() - self.start_time
-        remaining = self.time_limit - elapsed
+    def _within_time_limit(self, deadline):
+        """Check if we're still before the chain's monotonic deadline"""
+        remaining = deadline - time.monotonic()
         
-        if remaining.total_seconds() > 0:
-            logger.info(f"Time remaining: {remaining.total_seconds():.1f}s")
+        if remaining > 0:
+            logger.info(f"Time remaining: {remaining:.1f}s")
             return True
         else:
             logger.warning("Time limit exceeded!")
@@ -0,0 +1,8 @@
+"""
+WSGI entrypoint for production servers.
+
+Run a single worker so every request shares the in-process browser pool:
+    gunicorn -k gthread --workers 1 --threads $BROWSER_POOL_SIZE wsgi:app
+"""
+
+from app import app